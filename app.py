@@ -2,8 +2,10 @@ from flask import Flask, jsonify, request, render_template
 from flask_cors import CORS
 from services.data_loader import load_inflation_data_us, load_inflation_data_id, load_bi_rate, load_fed_rate, load_jkse, load_sp500, load_usdidr
 from models.technical_indicators import apply_technical_indicators
-from services.news_service import get_combined_news 
+from services.news_service import refresh_news, get_relevant_headlines, market_news_query
+from services.news_store import decode_cursor
 from services.gemini_service import generate_recommendation, generate_analysis_report_and_recommendation
+from services.snapshot_cache import SnapshotCache, SessionStore
 import math
 from datetime import datetime, timedelta
 import numpy as np
@@ -34,10 +36,9 @@ class NpEncoder(json.JSONEncoder):
             return None
         return super(NpEncoder, self).default(obj)
 
-# Global variables
-global_predictions = None
-last_prediction_time = None
 prediction_cache_duration = timedelta(hours=1)  # Cache duration, adjust as needed
+quote_cache_duration = timedelta(minutes=5)  # Spot quotes (USD/IDR, JKSE, S&P 500) stay fresher than the history
+session_history_duration = timedelta(hours=24)  # Chat sessions idle for longer than this are deleted
 
 def safe_float(value):
     if isinstance(value, dict):
@@ -52,28 +53,76 @@ def safe_float(value):
     except (ValueError, TypeError):
         return None
 
-def get_or_update_predictions(forecast_days=14):
-    global global_predictions, last_prediction_time
-    
-    current_time = datetime.now()
-    if global_predictions is None or last_prediction_time is None or (current_time - last_prediction_time) > prediction_cache_duration:
-        # Load data
-        _, _, _, usdidr_full = load_usdidr()
-        if usdidr_full.empty:
-            app.logger.warning("USD/IDR data is empty. Unable to make predictions.")
-            return []
-        
+# Function to load the slow-moving indicators and the USD/IDR history with technical indicators for the shared snapshot
+def build_market_snapshot():
+    inflation_us, inflation_us_trend = load_inflation_data_us()
+    inflation_id, inflation_id_trend = load_inflation_data_id()
+    bi_rate, bi_rate_trend = load_bi_rate()
+    fed_rate, fed_rate_trend = load_fed_rate()
+    _, _, _, usdidr_full = load_usdidr()
+
+    app.logger.info(f"Loaded economic indicators: {inflation_us}, {inflation_id}, {bi_rate}, {fed_rate}")
+
+    # Apply technical indicators to the full USD/IDR dataset
+    if not usdidr_full.empty and 'Close' in usdidr_full.columns:
         usdidr_with_indicators = apply_technical_indicators(usdidr_full)
-        if usdidr_with_indicators.empty:
-            app.logger.warning("Technical indicators data is empty. Unable to make predictions.")
-            return []
-        
-        # Kirim data ke frontend untuk diproses
-        global_predictions = usdidr_with_indicators.to_dict('records')
-        last_prediction_time = current_time
+    else:
+        app.logger.warning("USD/IDR data is empty. Unable to make predictions.")
+        usdidr_with_indicators = pd.DataFrame(columns=['Date', 'Close'])
+
+    meta = {
+        'inflation_us': safe_float(inflation_us),
+        'inflation_us_trend': inflation_us_trend,
+        'inflation_id': safe_float(inflation_id),
+        'inflation_id_trend': inflation_id_trend,
+        'bi_rate': safe_float(bi_rate),
+        'bi_rate_trend': bi_rate_trend,
+        'fed_rate': safe_float(fed_rate),
+        'fed_rate_trend': fed_rate_trend,
+        'complete': not usdidr_with_indicators.empty,
+    }
+    return usdidr_with_indicators, meta
+
+# Function to load the spot quotes, kept in a separate snapshot with a shorter cache duration
+def build_quote_snapshot():
+    jkse, jkse_trend = load_jkse()
+    sp500, sp500_trend = load_sp500()
+    current_usdidr, usdidr_trend, usdidr_30days, _ = load_usdidr()
+
+    app.logger.info(f"Loaded spot quotes: {jkse}, {sp500}, {current_usdidr}")
+
+    meta = {
+        'jkse': safe_float(jkse),
+        'jkse_trend': jkse_trend,
+        'sp500': safe_float(sp500),
+        'sp500_trend': sp500_trend,
+        'current_usdidr': safe_float(current_usdidr),
+        'usdidr_trend': usdidr_trend,
+        'usdidr_1month_ago': safe_float(usdidr_30days.iloc[0]['Close']) if usdidr_30days is not None and len(usdidr_30days) > 0 else None,
+        'complete': safe_float(current_usdidr) is not None,
+    }
+    return pd.DataFrame(), meta
+
+# Snapshot pasar dan riwayat chat dibagi ke semua worker, sehingga data hanya diunduh sekali per host
+market_cache = SnapshotCache(build_market_snapshot, ttl=prediction_cache_duration)
+quote_cache = SnapshotCache(build_quote_snapshot, ttl=quote_cache_duration, name='quotes')
+session_history = SessionStore(max_age=session_history_duration)
+
+# Function to get the market snapshot, all indicator values and a version identifying both snapshots
+def get_market_state():
+    snapshot = market_cache.get()
+    quotes = quote_cache.get()
+    indicators = {**snapshot.meta, **quotes.meta}
+    return snapshot, indicators, (snapshot.version, quotes.version)
+
+def get_or_update_predictions(forecast_days=14, snapshot=None):
+    if snapshot is None:
+        snapshot = market_cache.get()
+    if len(snapshot) == 0:
+        return []
     
     # Pastikan kita hanya mengembalikan nilai prediksi, bukan seluruh dictionary
-    return [safe_float(pred.get('Close', pred.get('predicted_usdidr', None))) for pred in global_predictions[-forecast_days:]]
+    return [safe_float(pred) for pred in snapshot.column('Close')[-forecast_days:]]
 
 @app.route('/')
 def index():
@@ -86,28 +135,15 @@ def get_economic_indicators():
         
         forecast_days = int(request.args.get('forecast_days', 14))
         
-        # Load all necessary economic indicators
-        inflation_us, inflation_us_trend = load_inflation_data_us()
-        inflation_id, inflation_id_trend = load_inflation_data_id()
-        bi_rate, bi_rate_trend = load_bi_rate()
-        fed_rate, fed_rate_trend = load_fed_rate()
-        jkse, jkse_trend = load_jkse()
-        sp500, sp500_trend = load_sp500()
-        current_usdidr, usdidr_trend, usdidr_30days, usdidr_full = load_usdidr()
-
-        app.logger.info(f"Loaded economic indicators: {inflation_us}, {inflation_id}, {bi_rate}, {fed_rate}, {jkse}, {sp500}, {current_usdidr}")
-
-        # Apply technical indicators to the full USD/IDR dataset
-        if not usdidr_full.empty and 'Close' in usdidr_full.columns:
-            usdidr_with_indicators = apply_technical_indicators(usdidr_full)
-        else:
-            usdidr_with_indicators = pd.DataFrame()
+        # Load all economic indicators from the shared snapshots (refreshed by one worker when stale)
+        snapshot, indicators, snapshot_version = get_market_state()
+        usdidr_with_indicators = snapshot.frame()
 
         # Get or update predictions
-        predictions = get_or_update_predictions(forecast_days)
+        predictions = get_or_update_predictions(forecast_days, snapshot=snapshot)
 
         # Prepare USDIDR history
-        usdidr_history = usdidr_full[['Date', 'Close']].to_dict('records') if not usdidr_full.empty else []
+        usdidr_history = usdidr_with_indicators[['Date', 'Close']].to_dict('records') if not usdidr_with_indicators.empty else []
 
         app.logger.info(f"USDIDR history: {usdidr_history}")
 
@@ -116,39 +152,39 @@ def get_economic_indicators():
 
         app.logger.info(f"USDIDR predictions: {prediction_data}")
 
-        # Fetch latest news
-        news_df = get_combined_news()
-        news_text = news_df['Title'].to_markdown(index=False) if not news_df.empty else "No recent news available."
+        # Fetch the latest news most relevant to the market
+        news_text = get_relevant_headlines(market_news_query)
 
         # Generate AI Insight
         ai_insight = generate_analysis_report_and_recommendation(
-            fed_rate=safe_float(fed_rate),
-            bi_rate=safe_float(bi_rate),
-            inflation_id=safe_float(inflation_id),
-            inflation_us=safe_float(inflation_us),
-            current_jkse=safe_float(jkse),
-            current_sp500=safe_float(sp500),
-            current_usdidr=safe_float(current_usdidr),
-            usdidr_1month_ago=safe_float(usdidr_30days.iloc[0]['Close']) if usdidr_30days is not None and len(usdidr_30days) > 0 else None,
+            fed_rate=indicators['fed_rate'],
+            bi_rate=indicators['bi_rate'],
+            inflation_id=indicators['inflation_id'],
+            inflation_us=indicators['inflation_us'],
+            current_jkse=indicators['jkse'],
+            current_sp500=indicators['sp500'],
+            current_usdidr=indicators['current_usdidr'],
+            usdidr_1month_ago=indicators['usdidr_1month_ago'],
             predictions=[safe_float(p['predicted_usdidr']) for p in prediction_data],
-            news_text=news_text
+            news_text=news_text,
+            snapshot_version=snapshot_version
         )
 
         json_response = {
-            'inflation_us': safe_float(inflation_us),
-            'inflation_us_trend': inflation_us_trend,
-            'inflation_id': safe_float(inflation_id),
-            'inflation_id_trend': inflation_id_trend,
-            'bi_rate': safe_float(bi_rate),
-            'bi_rate_trend': bi_rate_trend,
-            'fed_rate': safe_float(fed_rate),
-            'fed_rate_trend': fed_rate_trend,
-            'jkse': safe_float(jkse),
-            'jkse_trend': jkse_trend,
-            'sp500': safe_float(sp500),
-            'sp500_trend': sp500_trend,
-            'current_usdidr': safe_float(current_usdidr),
-            'usdidr_trend': usdidr_trend,
+            'inflation_us': indicators['inflation_us'],
+            'inflation_us_trend': indicators['inflation_us_trend'],
+            'inflation_id': indicators['inflation_id'],
+            'inflation_id_trend': indicators['inflation_id_trend'],
+            'bi_rate': indicators['bi_rate'],
+            'bi_rate_trend': indicators['bi_rate_trend'],
+            'fed_rate': indicators['fed_rate'],
+            'fed_rate_trend': indicators['fed_rate_trend'],
+            'jkse': indicators['jkse'],
+            'jkse_trend': indicators['jkse_trend'],
+            'sp500': indicators['sp500'],
+            'sp500_trend': indicators['sp500_trend'],
+            'current_usdidr': indicators['current_usdidr'],
+            'usdidr_trend': indicators['usdidr_trend'],
             'usdidr_history': usdidr_history,
             'usdidr_data': [{k: safe_float(v) if isinstance(v, (int, float)) else v for k, v in d.items()} for d in usdidr_with_indicators.to_dict('records')] if not usdidr_with_indicators.empty else [],
             'usdidr_predictions': prediction_data,
@@ -161,64 +197,71 @@ def get_economic_indicators():
         app.logger.error(f"Error in get_economic_indicators: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def parse_news_date(value, end_of_day=False):
+    if not value:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('Asia/Jakarta')
+    # Tanggal tanpa jam pada batas akhir mencakup seluruh hari tersebut
+    if end_of_day and len(value) == 10:
+        timestamp += timedelta(days=1)
+    return timestamp.timestamp()
+
 @app.route('/api/news', methods=['GET'])
 def get_news():
     try:
         app.logger.info("Fetching news")
-        # Fetch combined news from all routes
-        news_df = get_combined_news()
-        
-        # Ensure all necessary columns are present and rename them if needed
+        try:
+            limit = request.args.get('limit')
+            if limit is not None:
+                limit = int(limit)
+                if limit <= 0:
+                    raise ValueError("limit must be a positive integer")
+            cursor = request.args.get('cursor')
+            if cursor:
+                decode_cursor(cursor)
+            start = parse_news_date(request.args.get('start'))
+            end = parse_news_date(request.args.get('end'), end_of_day=True)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Search the news store (refreshed from all routes when stale)
+        news_items, next_cursor = refresh_news().search(
+            q=request.args.get('q'),
+            source=request.args.get('source'),
+            start=start,
+            end=end,
+            cursor=cursor,
+            limit=limit
+        )
+
+        # Rename columns to the names used by the frontend
         column_mapping = {
             'Title': 'headline',
             'Description': 'summary',
             'Source': 'source',
             'Publication Date': 'date',
             'Link': 'link',
-            'Image': 'image'  # Add this line
+            'Image': 'image'
         }
-        news_df = news_df.rename(columns=column_mapping)
-        
-        required_columns = ['headline', 'summary', 'source', 'date', 'link', 'image']  # Add 'image' here
-        for col in required_columns:
-            if col not in news_df.columns:
-                news_df[col] = 'N/A'
-        
-        # Convert date to string format if it's not already
-        news_df['date'] = news_df['date'].astype(str)
-        
-        # Convert news DataFrame to list of dictionaries
-        news_list = news_df[required_columns].to_dict(orient='records')
-        
+        news_list = [{column_mapping[k]: v for k, v in item.items()} for item in news_items]
+
         # Return the news data in JSON format
-        app.logger.info(f"Returning news: {news_list}")
-        return jsonify({'news': news_list})
+        app.logger.info(f"Returning {len(news_list)} news items")
+        return jsonify({'news': news_list, 'next_cursor': next_cursor})
     except Exception as e:
         app.logger.error(f"Error in get_news: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-session_history = {}
-
 @app.route('/api/ai-recommendation', methods=['POST'])
 def get_ai_recommendation():
     try:
         app.logger.info("Received AI recommendation request")
         
-        # Load economic indicators and predictions
-        inflation_us, _ = load_inflation_data_us()
-        inflation_id, _ = load_inflation_data_id()
-        bi_rate, _ = load_bi_rate()
-        fed_rate, _ = load_fed_rate()
-        jkse, _ = load_jkse()
-        sp500, _ = load_sp500()
-        current_usdidr, _, usdidr_30days, _ = load_usdidr()
-
-        # Get predictions
-        predictions = get_or_update_predictions()
-
-        # Fetch latest news
-        news_df = get_combined_news()
-        news_text = news_df['Title'].to_markdown(index=False)
+        # Load economic indicators and predictions from the shared snapshots
+        snapshot, indicators, snapshot_version = get_market_state()
+        predictions = get_or_update_predictions(snapshot=snapshot)
 
         # Get user question and session ID from the request body
         data = request.get_json()
@@ -226,6 +269,9 @@ def get_ai_recommendation():
             return jsonify({'error': 'No JSON data provided'}), 400
         
         user_question = data.get('question', 'Apa rekomendasi Anda?')
+
+        # Fetch the latest news most relevant to the question and the market
+        news_text = get_relevant_headlines(f"{user_question} {market_news_query}")
         session_id = data.get('session_id')
 
         if not session_id:
@@ -243,18 +289,19 @@ def get_ai_recommendation():
 
         # Generate AI-based recommendation
         updated_history = generate_recommendation(
-            fed_rate=safe_float(fed_rate),
-            bi_rate=safe_float(bi_rate),
-            inflation_id=safe_float(inflation_id),
-            inflation_us=safe_float(inflation_us),
-            current_jkse=safe_float(jkse),
-            current_sp500=safe_float(sp500),
-            current_usdidr=safe_float(current_usdidr),
-            usdidr_1month_ago=safe_float(usdidr_30days.iloc[0]['Close']) if usdidr_30days is not None and len(usdidr_30days) > 0 else None,
+            fed_rate=indicators['fed_rate'],
+            bi_rate=indicators['bi_rate'],
+            inflation_id=indicators['inflation_id'],
+            inflation_us=indicators['inflation_us'],
+            current_jkse=indicators['jkse'],
+            current_sp500=indicators['sp500'],
+            current_usdidr=indicators['current_usdidr'],
+            usdidr_1month_ago=indicators['usdidr_1month_ago'],
             predictions=[safe_float(p) for p in predictions] if predictions is not None else [],
             news_text=news_text,
             user_question=user_question,
-            history=session_history[session_id]
+            history=session_history[session_id],
+            snapshot_version=snapshot_version
         )
 
         # Update session history with the new conversation
@@ -0,0 +1,189 @@
+"""Checks for the Gemini gateway against a local fake model.
+
+Usage (from the repository root):
+
+    python -m benchmarks.gateway
+
+Each scenario drives ``GeminiGateway`` (or the full app) with ``FakeGemini``,
+which records model calls and their latency, and exits with status 1 if the
+gateway made more upstream calls than expected, let more calls run at once
+than allowed, or failed to retry quota errors. The ``host_wide`` scenarios run
+several worker processes against one cache directory, like gunicorn workers.
+"""
+import atexit
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+os.environ['SNAPSHOT_CACHE_DIR'] = tempfile.mkdtemp(prefix='forex-gateway-')
+atexit.register(shutil.rmtree, os.environ['SNAPSHOT_CACHE_DIR'], ignore_errors=True)
+
+from google.api_core import exceptions as google_exceptions
+
+import app as dashboard_app
+from services import gemini_service
+from services.gemini_service import GeminiGateway, GatewayBusyError
+from benchmarks.offline import FakeGemini, offline
+
+class HostWideFake(FakeGemini):
+    """FakeGemini that also counts calls and concurrency across processes.
+
+    ``counters`` is a shared array of [calls, in flight, peak in flight]; every
+    answer carries its call number, so answers from separate calls differ.
+    """
+
+    def __init__(self, counters, latency=0.0):
+        super().__init__(latency=latency)
+        self.counters = counters
+
+    def respond(self, prompt, text):
+        with self.counters.get_lock():
+            self.counters[0] += 1
+            self.counters[1] += 1
+            self.counters[2] = max(self.counters[2], self.counters[1])
+            number = self.counters[0]
+        try:
+            return super().respond(prompt, f"{text} (jawaban #{number})")
+        finally:
+            with self.counters.get_lock():
+                self.counters[1] -= 1
+
+def run_concurrently(fn, n):
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            return fn(i), time.perf_counter() - start
+        except Exception as e:
+            return e, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(timed, range(n)))
+
+def summarize(outcomes):
+    latencies = sorted(latency for _, latency in outcomes)
+    return f"p50={statistics.median(latencies) * 1000:.0f} ms  max={latencies[-1] * 1000:.0f} ms"
+
+def check_coalescing():
+    fake = FakeGemini(latency=0.2)
+    gateway = GeminiGateway(model_factory=fake)
+    outcomes = run_concurrently(lambda i: gateway.generate("Apa rekomendasi Anda?"), 32)
+    ok = fake.calls == 1 and all(isinstance(result, str) for result, _ in outcomes)
+    return ok, f"32 identical concurrent prompts -> {fake.calls} model call(s), {summarize(outcomes)}"
+
+def check_cache():
+    fake = FakeGemini()
+    gateway = GeminiGateway(model_factory=fake)
+    for question in ["Apa rekomendasi Anda?", "apa rekomendasi  anda", "Apa rekomendasi Anda?!"]:
+        gateway.generate(question, cache_key=('recommendation', gemini_service.normalize_question(question), 1))
+    gateway.generate("Apa rekomendasi Anda?", cache_key=('recommendation', gemini_service.normalize_question("Apa rekomendasi Anda?"), 2))
+    ok = fake.calls == 2
+    return ok, f"3 phrasings on snapshot 1 + 1 on snapshot 2 -> {fake.calls} model call(s)"
+
+def check_admission():
+    fake = FakeGemini(latency=0.1)
+    gateway = GeminiGateway(model_factory=fake, max_in_flight=4)
+    outcomes = run_concurrently(lambda i: gateway.generate(f"Pertanyaan {i}"), 16)
+    ok = fake.calls == 16 and fake.max_in_flight <= 4
+    return ok, f"16 distinct prompts, cap 4 -> peak {fake.max_in_flight} in flight, {summarize(outcomes)}"
+
+def check_queue_deadline():
+    fake = FakeGemini(latency=0.3)
+    gateway = GeminiGateway(model_factory=fake, max_in_flight=1, queue_timeout=0.05)
+    outcomes = run_concurrently(lambda i: gateway.generate(f"Pertanyaan {i}"), 3)
+    busy = sum(1 for result, _ in outcomes if isinstance(result, GatewayBusyError))
+    ok = busy == 2 and fake.calls == 1
+    return ok, f"3 prompts, cap 1, 50 ms queue deadline -> {busy} rejected, {fake.calls} model call(s)"
+
+def check_retry():
+    fake = FakeGemini(failures=2)
+    gateway = GeminiGateway(model_factory=fake, max_retries=3, backoff_base=0.01)
+    result = gateway.generate("Apa rekomendasi Anda?")
+    recovered = isinstance(result, str) and fake.calls == 3
+
+    fake = FakeGemini(failures=10)
+    gateway = GeminiGateway(model_factory=fake, max_retries=2, backoff_base=0.01)
+    try:
+        gateway.generate("Apa rekomendasi Anda?")
+        gave_up = False
+    except google_exceptions.ResourceExhausted:
+        gave_up = fake.calls == 3
+    return recovered and gave_up, f"2 quota errors recovered after 3 calls: {recovered}; gave up after max_retries: {gave_up}"
+
+def check_app_first_turn():
+    fake = FakeGemini(latency=0.1)
+    gemini_service.gemini_gateway.clear_cache()
+    with offline(gemini=fake):
+        dashboard_app.market_cache.get()
+
+        def ask(i):
+            response = dashboard_app.app.test_client().post('/api/ai-recommendation', json={'session_id': f'bench-{time.time_ns()}-{i}'})
+            return response.get_json()['chat_history'][-1]['content']
+
+        outcomes = run_concurrently(ask, 16)
+    ok = fake.calls == 1 and len({result for result, _ in outcomes}) == 1
+    return ok, f"16 new sessions asking the default question -> {fake.calls} model call(s), {summarize(outcomes)}"
+
+def host_wide_cache_worker(cache_dir, counters, barrier, results):
+    gateway = GeminiGateway(model_factory=HostWideFake(counters, latency=0.2), cache_dir=cache_dir)
+    answers = []
+    for question in ["Apa rekomendasi Anda?", "apa rekomendasi anda"]:
+        barrier.wait()
+        answers.append(gateway.generate(question, cache_key=('recommendation', gemini_service.normalize_question(question), 1)))
+    results.put(answers)
+
+def host_wide_admission_worker(cache_dir, counters, barrier, results):
+    gateway = GeminiGateway(model_factory=HostWideFake(counters, latency=0.1), max_in_flight=4, cache_dir=cache_dir)
+    barrier.wait()
+    outcomes = run_concurrently(lambda i: gateway.generate(f"Pertanyaan {os.getpid()}-{i}"), 4)
+    results.put(sum(1 for result, _ in outcomes if isinstance(result, str)))
+
+# Function to run target in n worker processes sharing one cache directory; returns their results and the shared counters
+def run_workers(target, n):
+    context = multiprocessing.get_context('fork')
+    cache_dir = tempfile.mkdtemp(prefix='forex-gateway-workers-')
+    counters = context.Array('i', 3)
+    results = context.Queue()
+    barrier = context.Barrier(n)
+    try:
+        processes = [context.Process(target=target, args=(cache_dir, counters, barrier, results)) for _ in range(n)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=120) for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return outcomes, list(counters)
+
+def check_host_wide_cache():
+    outcomes, (calls, _, _) = run_workers(host_wide_cache_worker, 4)
+    answers = {answer for answers in outcomes for answer in answers}
+    ok = calls == 1 and len(answers) == 1
+    return ok, f"4 workers x 2 phrasings of one question -> {calls} model call(s), {len(answers)} distinct answer(s)"
+
+def check_host_wide_admission():
+    outcomes, (calls, _, peak) = run_workers(host_wide_admission_worker, 4)
+    ok = sum(outcomes) == 16 and calls == 16 and peak <= 4
+    return ok, f"4 workers x 4 distinct prompts, cap 4 -> peak {peak} in flight on the host, {sum(outcomes)} answered"
+
+def main():
+    checks = [check_coalescing, check_cache, check_admission, check_queue_deadline, check_retry, check_app_first_turn,
+              check_host_wide_cache, check_host_wide_admission]
+    failures = 0
+    for check in checks:
+        ok, detail = check()
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {check.__name__}: {detail}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from google.api_core import exceptions as google_exceptions
+
+import services.data_loader as data_loader
+import services.gemini_service as gemini_service
+import services.news_service as news_service
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Map ticker Yahoo Finance ke file fixture yang direkam
+TICKER_FIXTURES = {
+    'USDIDR=X': 'usdidr.csv',
+    '^JKSE': 'jkse.csv',
+    '^GSPC': 'gspc.csv',
+}
+
+# Function to load a recorded yfinance history frame
+def load_history_fixture(filename):
+    frame = pd.read_csv(os.path.join(FIXTURES_DIR, filename))
+    index = pd.to_datetime(frame.pop('Date'), utc=True).dt.tz_convert('Europe/London')
+    frame.index = pd.DatetimeIndex(index, name='Date')
+    return frame
+
+# Function to load the recorded news API responses, keyed by "route/category"
+def load_news_fixture(filename='news.json'):
+    with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+        return json.load(f)
+
+# Function to generate a synthetic USD/IDR history shaped like yf.Ticker.history()
+def synthetic_history(n_days, seed=0, start='1990-01-01', base=15000.0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start=start, periods=n_days, tz='Europe/London', name='Date')
+    close = base * np.exp(np.cumsum(rng.normal(0, 0.004, n_days)))
+    spread = np.abs(rng.normal(0, 0.002, n_days)) * close
+    frame = pd.DataFrame({
+        'Open': close + rng.normal(0, 0.001, n_days) * close,
+        'High': close + spread,
+        'Low': close - spread,
+        'Close': close,
+        'Volume': 0,
+        'Dividends': 0.0,
+        'Stock Splits': 0.0,
+    }, index=index)
+    # Data Yahoo asli kadang berisi nilai 0 atau terlalu kecil, sisipkan beberapa agar jalur interpolasi ikut teruji
+    bad_rows = rng.choice(n_days, size=max(1, n_days // 500), replace=False)
+    frame.iloc[bad_rows, frame.columns.get_loc('Close')] = 0.0
+    return frame
+
+# Kosakata untuk judul berita sintetis
+NEWS_SUBJECTS = ['Rupiah', 'The Fed', 'Bank Indonesia', 'IHSG', 'Harga emas', 'Inflasi AS', 'Wall Street', 'Ekspor Indonesia', 'Harga minyak', 'Dolar AS', 'Cadangan devisa', 'Yield obligasi AS']
+NEWS_VERBS = ['menguat', 'melemah', 'naik tipis', 'turun tajam', 'stabil', 'tertekan', 'rebound', 'diprediksi bergerak', 'mencetak rekor', 'terkoreksi']
+NEWS_TAILS = ['jelang rilis data inflasi', 'usai keputusan suku bunga', 'di tengah ketegangan geopolitik', 'pekan ini', 'pada perdagangan pagi', 'jelang FOMC', 'akibat sentimen global', 'setelah data tenaga kerja AS']
+NEWS_SOURCES = ['Sindonews - Ekbis', 'Sindonews - International', 'Tempo - Bisnis', 'Antara - Politik', 'Cnn - Internasional']
+
+# Function to generate n synthetic news items in the format stored by the news service
+def synthetic_news(n_items, seed=0, end='2024-10-18T20:00:00+07:00'):
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end)
+    items = []
+    for i in range(n_items):
+        title = f"{rng.choice(NEWS_SUBJECTS)} {rng.choice(NEWS_VERBS)} {rng.choice(NEWS_TAILS)} ({i})"
+        source = NEWS_SOURCES[i % len(NEWS_SOURCES)]
+        items.append({
+            'Title': title,
+            'Description': f"{title}. Pelaku pasar mencermati arah kebijakan moneter dan pergerakan kurs USD/IDR.",
+            'Publication Date': (end - pd.Timedelta(minutes=int(rng.integers(0, 60 * 24 * 90)))).isoformat(),
+            'Source': source,
+            'Link': f"https://www.{source.split(' - ')[0].lower()}.com/read/{i}",
+            'Image': '',
+        })
+    return items
+
+class FakeTicker:
+    def __init__(self, frame):
+        self._frame = frame
+
+    def history(self, *args, **kwargs):
+        return self._frame.copy()
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise news_service.requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+    def json(self):
+        return self._payload
+
+class FakeGemini:
+    """Local stand-in for ``genai.GenerativeModel``.
+
+    Calling it returns a fake model; every model call is counted, its latency
+    recorded and the peak number of concurrent calls tracked. The first
+    ``failures`` calls raise ``error`` to exercise retry handling.
+    """
+
+    def __init__(self, latency=0.0, failures=0, error=None):
+        self.latency = latency
+        self.failures = failures
+        self.error = error or (lambda: google_exceptions.ResourceExhausted("Quota exceeded (fake)"))
+        self.calls = 0
+        self.prompts = []
+        self.latencies = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        return FakeGenerativeModel(self, kwargs)
+
+    def respond(self, prompt, text):
+        start = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.calls <= self.failures
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise self.error()
+            return mock.Mock(text=text)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.latencies.append(time.perf_counter() - start)
+
+class FakeGenerativeModel:
+    def __init__(self, gemini, kwargs):
+        self.gemini = gemini
+        self.kwargs = kwargs
+
+    def generate_content(self, prompt):
+        return self.gemini.respond(prompt, "LAPORAN SINGKAT: offline. REKOMENDASI CEPAT: tahan.")
+
+    def start_chat(self, history=None):
+        chat = mock.Mock()
+        chat.send_message.side_effect = lambda prompt: self.gemini.respond(prompt, "Rekomendasi offline: tahan.")
+        return chat
+
+class OfflineSources:
+    """Recorded market data, news and LLM responses served in place of the network."""
+
+    def __init__(self, histories=None, news=None, gemini=None):
+        self.gemini = gemini or FakeGemini()
+        self.histories = {ticker: load_history_fixture(filename) for ticker, filename in TICKER_FIXTURES.items()}
+        self.histories.update(histories or {})
+        self.news = load_news_fixture() if news is None else news
+
+    def ticker(self, symbol):
+        return FakeTicker(self.histories.get(symbol, pd.DataFrame()))
+
+    def get(self, url, *args, **kwargs):
+        key = url[len(news_service.base_url):].strip('/')
+        if key not in self.news:
+            return FakeResponse({'success': False, 'data': {}}, status_code=404)
+        return FakeResponse(self.news[key])
+
+@contextmanager
+def offline(histories=None, news=None, gemini=None):
+    sources = OfflineSources(histories=histories, news=news, gemini=gemini)
+    with mock.patch.object(data_loader.yf, 'Ticker', side_effect=sources.ticker), \
+            mock.patch.object(news_service.requests, 'get', side_effect=sources.get), \
+            mock.patch.object(gemini_service.genai, 'GenerativeModel', sources.gemini):
+        yield sources
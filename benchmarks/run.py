@@ -0,0 +1,296 @@
+"""Offline benchmark and regression suite for the data pipeline.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run                     # run and compare against benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline   # record a new baseline
+    python -m benchmarks.run -k indicators --sizes 1000 4000
+
+The run exits with status 1 when any tracked stage is slower than its baseline
+best time (min over --repeat runs) by more than --threshold (relative) and --min-delta (absolute seconds).
+Timings are only comparable on the machine that recorded the baseline: when the
+environment differs, slow stages are reported as a warning and the run still
+passes, unless --threshold is given explicitly.
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loader membaca file dari path relatif 'data/...', jadi benchmark selalu dijalankan dari root repo
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Snapshot benchmark tidak boleh memakai atau menimpa cache milik server yang sedang berjalan
+os.environ['SNAPSHOT_CACHE_DIR'] = tempfile.mkdtemp(prefix='forex-bench-')
+atexit.register(shutil.rmtree, os.environ['SNAPSHOT_CACHE_DIR'], ignore_errors=True)
+
+import numpy as np
+import pandas as pd
+
+import app as dashboard_app
+from models import technical_indicators
+from services import data_loader, gemini_service, news_service
+from services.news_store import NewsStore
+from benchmarks.offline import offline, synthetic_history, synthetic_news
+
+BASELINE_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_SIZES = [1000, 4000, 16000]
+NEWS_SIZES = [500, 5000]
+
+class Stage:
+    def __init__(self, name, fn, setup=None, histories=None):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.histories = histories
+
+    def run(self, repeat, warmup=1):
+        timings = []
+        with offline(histories=self.histories):
+            for i in range(warmup + repeat):
+                args = self.setup() if self.setup else ()
+                start = time.perf_counter()
+                self.fn(*args)
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    timings.append(elapsed)
+        return {
+            'median_s': statistics.median(timings),
+            'min_s': min(timings),
+            'repeat': repeat,
+        }
+
+# Function to get the USD/IDR frame as it enters apply_technical_indicators
+def prepared_usdidr(history):
+    with offline(histories={'USDIDR=X': history}):
+        return data_loader.load_usdidr()[3]
+
+# Function to reset the news store so every call refetches and reindexes all feeds
+def reset_news_store():
+    news_service.news_store = NewsStore()
+    return ()
+
+# Function to reset the market snapshots and news store so every endpoint call takes the cold path
+def reset_app_cache():
+    dashboard_app.market_cache.clear()
+    dashboard_app.quote_cache.clear()
+    gemini_service.gemini_gateway.clear_cache()
+    return reset_news_store()
+
+# Function to build a fully indexed news store of n synthetic items
+def filled_news_store(n_items):
+    store = NewsStore(max_items=n_items)
+    store.add_many(synthetic_news(n_items, seed=n_items))
+    return store
+
+def build_data_payload(usdidr_with_indicators):
+    return {
+        'usdidr_history': usdidr_with_indicators[['Date', 'Close']].to_dict('records'),
+        'usdidr_data': [{k: dashboard_app.safe_float(v) if isinstance(v, (int, float)) else v for k, v in d.items()} for d in usdidr_with_indicators.to_dict('records')],
+    }
+
+def build_stages(sizes):
+    client = dashboard_app.app.test_client()
+
+    def get_ok(url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_data()
+
+    stages = [
+        Stage('loader.inflation_us', data_loader.load_inflation_data_us),
+        Stage('loader.inflation_id', data_loader.load_inflation_data_id),
+        Stage('loader.bi_rate', data_loader.load_bi_rate),
+        Stage('loader.fed_rate', data_loader.load_fed_rate),
+        Stage('loader.jkse', data_loader.load_jkse),
+        Stage('loader.sp500', data_loader.load_sp500),
+        Stage('loader.usdidr', data_loader.load_usdidr),
+        Stage('news.get_combined_news', news_service.get_combined_news, setup=reset_news_store),
+        Stage('endpoint.api_data', lambda: get_ok('/api/data'), setup=reset_app_cache),
+        Stage('endpoint.api_data[warm]', lambda: get_ok('/api/data')),
+        Stage('snapshot.get[warm]', dashboard_app.market_cache.get),
+        Stage('endpoint.api_news', lambda: get_ok('/api/news'), setup=reset_news_store),
+        Stage('endpoint.api_news[q,limit]', lambda: get_ok('/api/news?q=rupiah&source=tempo&limit=10')),
+    ]
+
+    # Lookup pada store yang sudah terisi: harus tetap sub-milidetik walau jumlah berita bertambah
+    for n in NEWS_SIZES:
+        store = filled_news_store(n)
+        _, cursor = store.search(limit=20)
+        stages.extend([
+            Stage(f'news.store.add_many[n={n}]', lambda items: NewsStore(max_items=len(items)).add_many(items), setup=lambda n=n: (synthetic_news(n, seed=n),)),
+            Stage(f'news.search.latest[n={n}]', lambda store=store: store.search(limit=20)),
+            Stage(f'news.search.cursor[n={n}]', lambda store=store, cursor=cursor: store.search(cursor=cursor, limit=20)),
+            Stage(f'news.search.query[n={n}]', lambda store=store: store.search(q='rupiah melemah', limit=20)),
+            Stage(f'news.search.source_date[n={n}]', lambda store=store, start=store.search(limit=1)[0][0]: store.search(source='tempo', start=pd.Timestamp(start['Publication Date']).timestamp() - 7 * 86400, limit=20)),
+            Stage(f'news.top_k[n={n}]', lambda store=store: store.top_k(f"Apa rekomendasi Anda? {news_service.market_news_query}", 10)),
+        ])
+
+    indicator_fns = {
+        'moving_average': lambda data: technical_indicators.moving_average(data, 200),
+        'macd': technical_indicators.macd,
+        'rate_of_change': technical_indicators.rate_of_change,
+        'momentum': technical_indicators.momentum,
+        'rsi': technical_indicators.rsi,
+        'bollinger_bands': technical_indicators.bollinger_bands,
+        'cci': technical_indicators.cci,
+        'apply_technical_indicators': technical_indicators.apply_technical_indicators,
+    }
+
+    for n in sizes:
+        history = synthetic_history(n, seed=n)
+        prepared = prepared_usdidr(history)
+        with_indicators = technical_indicators.apply_technical_indicators(prepared.copy())
+        payload = build_data_payload(with_indicators)
+
+        stages.append(Stage(f'loader.usdidr[n={n}]', data_loader.load_usdidr, histories={'USDIDR=X': history}))
+        for name, fn in indicator_fns.items():
+            # apply_technical_indicators mengubah DataFrame secara in-place, jadi setiap ulangan memakai salinan baru
+            stages.append(Stage(f'indicators.{name}[n={n}]', fn, setup=lambda prepared=prepared: (prepared.copy(),)))
+        stages.append(Stage(f'serialize.records[n={n}]', build_data_payload, setup=lambda w=with_indicators: (w,)))
+        stages.append(Stage(f'serialize.json[n={n}]', dashboard_app.app.json.dumps, setup=lambda p=payload: (p,)))
+        stages.append(Stage(f'endpoint.api_data[n={n}]', lambda: get_ok('/api/data'), setup=reset_app_cache, histories={'USDIDR=X': history}))
+
+    return stages
+
+# Function to get the CPU model name (platform.processor() is often empty on Linux)
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu': cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+# Function to list the environment fields that differ from the baseline (fields missing from an older baseline are skipped)
+def environment_differences(current, recorded):
+    return [f"{key}: {recorded[key]} -> {value}" for key, value in current.items() if key in recorded and recorded[key] != value]
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def compare(results, baseline, threshold, min_delta):
+    regressions = []
+    for name, result in results.items():
+        reference = baseline['stages'].get(name)
+        if reference is None:
+            result['status'] = 'new'
+            continue
+        # Bandingkan waktu tercepat: paling tidak terpengaruh noise dari proses lain di mesin
+        ratio = result['min_s'] / reference['min_s'] if reference['min_s'] > 0 else float('inf')
+        result['baseline_min_s'] = reference['min_s']
+        result['ratio'] = ratio
+        if ratio > 1 + threshold and result['min_s'] - reference['min_s'] > min_delta:
+            result['status'] = 'regression'
+            regressions.append(name)
+        else:
+            result['status'] = 'ok'
+    return regressions
+
+def print_report(results):
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = f"{name:<{width}}  min {result['min_s'] * 1000:10.3f} ms  median {result['median_s'] * 1000:10.3f} ms"
+        if 'ratio' in result:
+            line += f"  x{result['ratio']:.2f} vs {result['baseline_min_s'] * 1000:.3f} ms"
+        if 'status' in result:
+            line += f"  {result['status']}"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file to compare against or update.')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--output', help='Also write the results of this run to a JSON file.')
+    parser.add_argument('--threshold', type=float, help='Allowed relative slowdown per stage (default 0.5 = 50%%). '
+                        'Passing it explicitly also enforces it when the environment differs from the baseline.')
+    parser.add_argument('--min-delta', type=float, default=0.002, help='Ignore slowdowns smaller than this many seconds.')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repetitions per stage.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Synthetic history lengths in business days.')
+    parser.add_argument('-k', dest='keyword', help='Only run stages whose name contains this string.')
+    args = parser.parse_args(argv)
+
+    stages = build_stages(args.sizes)
+    if args.keyword:
+        stages = [stage for stage in stages if args.keyword in stage.name]
+
+    results = {}
+    for stage in stages:
+        results[stage.name] = stage.run(args.repeat)
+
+    report = {'environment': environment_info(), 'stages': results}
+
+    threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+    baseline = load_baseline(args.baseline)
+    regressions = []
+    if baseline is not None and not args.update_baseline:
+        regressions = compare(results, baseline, threshold, args.min_delta)
+        if regressions:
+            # Ulangi stage yang terdeteksi lambat sekali lagi sebelum dinyatakan regresi
+            for stage in stages:
+                if stage.name in regressions:
+                    retry = stage.run(args.repeat)
+                    if retry['min_s'] < results[stage.name]['min_s']:
+                        results[stage.name] = retry
+            regressions = compare(results, baseline, threshold, args.min_delta)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        if baseline is not None and args.keyword:
+            # Run parsial hanya memperbarui stage yang dijalankan
+            baseline['stages'].update(results)
+            baseline['environment'] = report['environment']
+            report = baseline
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed by more than {threshold:.0%}: {', '.join(regressions)}")
+        differences = environment_differences(report['environment'], baseline.get('environment', {}))
+        if differences and args.threshold is None:
+            # Waktu absolut dari mesin lain bukan batas yang adil; laporkan saja tanpa menggagalkan run
+            print(f"Warning: environment differs from the baseline ({'; '.join(differences)}); "
+                  "not failing. Pass --threshold explicitly to enforce it or record a baseline on this machine.")
+            return 0
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Multi-worker check for the shared market snapshots.
+
+Usage (from the repository root, Linux only):
+
+    python -m benchmarks.workers                 # 1, 2, 4 and 8 workers
+    python -m benchmarks.workers --workers 2 16 --days 16000
+
+Two phases run for every worker count:
+
+1. Cold start: every worker starts with an empty cache and requests /api/data
+   at the same moment, like gunicorn workers after a deploy. USD/IDR must be
+   fetched once per snapshot (history and spot quotes), however many workers
+   there are.
+2. Readers: fresh worker processes open the snapshot that is already on disk and
+   read every column. The private dirty memory each of them gains must stay
+   well below the snapshot size, while the resident size of the mapped snapshot
+   files accounts for it, i.e. the pages are shared through the memory map
+   rather than copied.
+
+Once per run it also checks that the shared chat session store hides and
+deletes sessions that have been idle for longer than their max age.
+
+The run exits with status 1 if any check fails.
+"""
+import argparse
+import atexit
+import gc
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+from datetime import timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_ROOT)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+# Cache default app (sesi chat, jawaban Gemini) tidak boleh memakai atau menimpa milik server yang sedang berjalan
+os.environ['SNAPSHOT_CACHE_DIR'] = tempfile.mkdtemp(prefix='forex-workers-app-')
+atexit.register(shutil.rmtree, os.environ['SNAPSHOT_CACHE_DIR'], ignore_errors=True)
+
+import numpy as np
+
+import app as dashboard_app
+from services.snapshot_cache import SessionStore, SnapshotCache
+from benchmarks.offline import offline, synthetic_history
+
+# Satu unduhan USD/IDR per snapshot: riwayat (market) dan kurs terkini (quotes)
+EXPECTED_FETCHES = 2
+
+# Function to read (in bytes) the private dirty memory outside the snapshot files and the resident size of the snapshot files mapped from cache_dir
+def read_memory(cache_dir):
+    # RssAnon tidak naik saat halaman heap warisan proses induk dipakai ulang, sedangkan Private_Dirty ikut menghitung salinan copy-on-write tersebut.
+    # Halaman file snapshot sendiri tidak dihitung: di tmpfs halaman itu selalu "dirty" dan terlihat private selama hanya satu proses yang memetakannya.
+    private_dirty = 0
+    mapped = 0
+    in_cache_file = False
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if not fields[0].endswith(':'):
+                in_cache_file = len(fields) >= 6 and fields[5].startswith(cache_dir)
+            elif fields[0] == 'Rss:' and in_cache_file:
+                mapped += int(fields[1]) * 1024
+            elif fields[0] == 'Private_Dirty:' and not in_cache_file:
+                private_dirty += int(fields[1]) * 1024
+    return private_dirty, mapped
+
+def use_cache_dir(cache_dir):
+    # Setiap worker punya objek cache sendiri, seperti proses gunicorn yang berbeda
+    dashboard_app.market_cache = SnapshotCache(dashboard_app.build_market_snapshot, ttl=dashboard_app.prediction_cache_duration, cache_dir=cache_dir)
+    dashboard_app.quote_cache = SnapshotCache(dashboard_app.build_quote_snapshot, ttl=dashboard_app.quote_cache_duration, cache_dir=cache_dir, name='quotes')
+
+def cold_start_worker(cache_dir, history, fetch_count, barrier, results):
+    use_cache_dir(cache_dir)
+    original_load_usdidr = dashboard_app.load_usdidr
+
+    def counting_load_usdidr():
+        with fetch_count.get_lock():
+            fetch_count.value += 1
+        return original_load_usdidr()
+
+    dashboard_app.load_usdidr = counting_load_usdidr
+    client = dashboard_app.app.test_client()
+    with offline(histories={'USDIDR=X': history}):
+        barrier.wait()
+        response = client.get('/api/data')
+        status = response.status_code
+        response.close()
+        snapshot = dashboard_app.market_cache.get()
+    results.put({'status': status, 'version': snapshot.version})
+
+def reader_worker(cache_dir, barrier, results):
+    use_cache_dir(cache_dir)
+    # Objek warisan proses induk tidak disentuh GC, agar salinan copy-on-write-nya tidak ikut terhitung
+    gc.freeze()
+    # Jalur kode get() (json, np.load) dipanaskan lewat snapshot quotes yang kecil agar biaya awalnya tidak ikut terukur
+    dashboard_app.quote_cache.get()
+    barrier.wait()
+    private_before, mapped_before = read_memory(cache_dir)
+    snapshot = dashboard_app.market_cache.get()
+    # Baca setiap kolom sampai habis agar semua halaman snapshot benar-benar dimuat
+    for col in snapshot.columns:
+        hashlib.sha1(np.ascontiguousarray(snapshot.column(col)).view(np.uint8)).digest()
+    private_after, mapped_after = read_memory(cache_dir)
+    results.put({
+        'nbytes': snapshot.nbytes,
+        'private_delta': private_after - private_before,
+        'mapped_delta': mapped_after - mapped_before,
+    })
+
+# Function to check that an idle session is hidden and then deleted from the database on the next write
+def check_session_expiry():
+    cache_dir = tempfile.mkdtemp(prefix='forex-sessions-')
+    try:
+        store = SessionStore(cache_dir=cache_dir, max_age=timedelta(hours=1))
+        store['idle'] = [{'role': 'assistant', 'content': 'Selamat datang'}]
+        # Mundurkan updated_at seolah-olah sesi sudah dua jam tidak aktif
+        conn = sqlite3.connect(store.path)
+        with conn:
+            conn.execute('UPDATE sessions SET updated_at = updated_at - 7200 WHERE session_id = ?', ('idle',))
+        conn.close()
+        hidden = 'idle' not in store
+        store['active'] = [{'role': 'assistant', 'content': 'Selamat datang'}]
+        return {'hidden': hidden, 'remaining': len(store)}
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def start_all(context, target, args_list):
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    return processes
+
+def run(n_workers, history):
+    context = multiprocessing.get_context('fork')
+    cache_dir = tempfile.mkdtemp(prefix='forex-workers-')
+    fetch_count = context.Value('i', 0)
+    results = context.Queue()
+    try:
+        barrier = context.Barrier(n_workers)
+        processes = start_all(context, cold_start_worker, [(cache_dir, history, fetch_count, barrier, results)] * n_workers)
+        cold = [results.get(timeout=600) for _ in processes]
+        for process in processes:
+            process.join()
+
+        barrier = context.Barrier(n_workers)
+        processes = start_all(context, reader_worker, [(cache_dir, barrier, results)] * n_workers)
+        readers = [results.get(timeout=600) for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        'workers': n_workers,
+        'upstream_fetches': fetch_count.value,
+        'statuses': sorted({report['status'] for report in cold}),
+        'versions': len({report['version'] for report in cold}),
+        'snapshot_bytes': readers[0]['nbytes'],
+        'private_delta_bytes': statistics.median(report['private_delta'] for report in readers),
+        'mapped_delta_bytes': statistics.median(report['mapped_delta'] for report in readers),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to try.')
+    parser.add_argument('--days', type=int, default=16000, help='Length of the synthetic USD/IDR history.')
+    parser.add_argument('--max-private', type=float, default=0.25, help='Allowed private dirty memory growth per reader, as a fraction of the snapshot size.')
+    parser.add_argument('--min-shared', type=float, default=0.5, help='Required resident size of the mapped snapshot files per reader, as a fraction of the snapshot size.')
+    parser.add_argument('--output', help='Also write the results to a JSON file.')
+    args = parser.parse_args(argv)
+
+    history = synthetic_history(args.days, seed=args.days)
+    runs = [run(n, history) for n in args.workers]
+
+    failures = []
+    for result in runs:
+        size = result['snapshot_bytes']
+        print(f"workers={result['workers']:<3} upstream_fetches={result['upstream_fetches']}  versions={result['versions']}  "
+              f"status={result['statuses']}  snapshot={size / 1024:.0f} KiB  "
+              f"per-reader private={result['private_delta_bytes'] / 1024:.0f} KiB  mapped={result['mapped_delta_bytes'] / 1024:.0f} KiB")
+        if result['upstream_fetches'] != EXPECTED_FETCHES:
+            failures.append(f"{result['workers']} workers fetched USD/IDR {result['upstream_fetches']} times (expected {EXPECTED_FETCHES})")
+        if result['versions'] != 1 or result['statuses'] != [200]:
+            failures.append(f"{result['workers']} workers did not all serve the same snapshot")
+        if result['private_delta_bytes'] > size * args.max_private:
+            failures.append(f"readers copied the snapshot into private memory with {result['workers']} workers")
+        if result['mapped_delta_bytes'] < size * args.min_shared:
+            failures.append(f"snapshot pages were not mapped from the shared file with {result['workers']} workers")
+
+    sessions = check_session_expiry()
+    print(f"sessions: idle session hidden={sessions['hidden']}  rows left after next write={sessions['remaining']}")
+    if not sessions['hidden'] or sessions['remaining'] != 1:
+        failures.append("idle chat sessions were not removed from the session store")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'runs': runs, 'sessions': sessions}, f, indent=2)
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,18 @@
 import os
+import random
+import re
+import threading
+import time
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import timedelta
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import logging
+from contextlib import contextmanager
+from services.snapshot_cache import DEFAULT_CACHE_DIR, AnswerCache, HostSemaphore, ensure_private_dir, try_lock_file
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +28,203 @@ generation_config = {
     "max_output_tokens": 8192,
 }
 
-def generate_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, current_jkse, current_sp500, current_usdidr, usdidr_1month_ago, predictions, news_text, user_question, history):
+# Errors worth retrying: quota exhausted, rate limited or a transient server problem
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+class GatewayBusyError(Exception):
+    """Raised when a call could not get an in-flight slot before its queue deadline."""
+
+# Function to normalize a question so trivially different phrasings share a cache entry
+def normalize_question(question):
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', str(question).lower())).strip()
+
+# Function to fingerprint the news text in a prompt, so cached answers expire when the headlines change
+def news_digest(news_text):
+    return hashlib.sha256(str(news_text).encode('utf-8')).hexdigest()
+
+def _default_model_factory(**kwargs):
+    return genai.GenerativeModel(**kwargs)
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class GeminiGateway:
+    """Single entry point for Gemini calls.
+
+    - at most ``max_in_flight`` calls run at once; others queue for up to
+      ``queue_timeout`` seconds and then fail with GatewayBusyError,
+    - identical prompts that are already in flight share one upstream call,
+    - answers passed a ``cache_key`` are kept for ``cache_ttl`` (at most ``cache_size`` of them),
+    - quota and transient errors are retried with full-jitter exponential backoff.
+
+    With ``cache_dir`` the limit, the answer cache and the coalescing of cached
+    prompts hold for every worker process on the host (lock files and SQLite in
+    that directory, next to the market snapshots). Without it they hold for this
+    process only.
+
+    ``model_factory`` builds the model (``genai.GenerativeModel`` by default), so a
+    local fake model can be plugged in for tests and benchmarks.
+    """
+
+    def __init__(self, model_factory=None, max_in_flight=4, queue_timeout=30.0, max_retries=3,
+                 backoff_base=1.0, backoff_max=20.0, cache_ttl=timedelta(hours=1), cache_size=256, cache_dir=None, key_stripes=64):
+        self.model_factory = model_factory or _default_model_factory
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.key_stripes = key_stripes
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._cache = OrderedDict()
+        if cache_dir is None:
+            self._slots = threading.BoundedSemaphore(max_in_flight)
+            self._shared_cache = None
+            self._key_lock_path = None
+        else:
+            self._slots = HostSemaphore(max_in_flight, cache_dir=cache_dir, name='gemini-slots')
+            self._shared_cache = AnswerCache(cache_ttl, max_entries=cache_size, cache_dir=cache_dir, filename='gemini-answers.sqlite3')
+            self._key_lock_path = os.path.join(ensure_private_dir(cache_dir), 'gemini-keys')
+            os.makedirs(self._key_lock_path, exist_ok=True)
+
+    def generate(self, prompt, model_name="gemini-1.5-flash", system_instruction=None, history=None, cache_key=None):
+        if cache_key is not None:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                logging.info("Gemini response served from cache")
+                return cached
+
+        call_key = hashlib.sha256(json.dumps([model_name, system_instruction, history, prompt], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        with self._lock:
+            call = self._in_flight.get(call_key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[call_key] = _InFlightCall()
+
+        if not leader:
+            # Prompt yang sama sedang diproses: tunggu hasil panggilan tersebut
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._cache_key_lock(cache_key):
+                # Worker lain mungkin baru saja menjawab pertanyaan yang sama selama kita menunggu kunci
+                cached = self._cache_get(cache_key) if cache_key is not None else None
+                if cached is not None:
+                    call.result = cached
+                else:
+                    call.result = self._call_with_admission(prompt, model_name, system_instruction, history)
+                    if cache_key is not None:
+                        self._cache_put(cache_key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[call_key]
+            call.done.set()
+
+    @contextmanager
+    def _cache_key_lock(self, cache_key):
+        # Antar proses: hanya satu worker yang memanggil model untuk cache_key yang sama, sisanya membaca hasilnya dari cache
+        if self._key_lock_path is None or cache_key is None:
+            yield
+            return
+        stripe = int(self._cache_digest(cache_key)[:8], 16) % self.key_stripes
+        path = os.path.join(self._key_lock_path, f'key-{stripe}.lock')
+        deadline = time.monotonic() + self.queue_timeout
+        lock_file = try_lock_file(path)
+        while lock_file is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+            lock_file = try_lock_file(path)
+        try:
+            # Jika kunci tidak didapat sebelum batas waktu, panggil model sendiri daripada gagal
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def _call_with_admission(self, prompt, model_name, system_instruction, history):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise GatewayBusyError(f"No Gemini slot free within {self.queue_timeout}s ({self.max_in_flight} calls in flight)")
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return self._call_model(prompt, model_name, system_instruction, history)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    logging.warning(f"Gemini call failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+    def _call_model(self, prompt, model_name, system_instruction, history):
+        model_kwargs = {"model_name": model_name, "generation_config": generation_config}
+        if system_instruction is not None:
+            model_kwargs["system_instruction"] = system_instruction
+        model = self.model_factory(**model_kwargs)
+        if history is None:
+            return model.generate_content(prompt).text
+        return model.start_chat(history=history).send_message(prompt).text
+
+    @staticmethod
+    def _cache_digest(key):
+        return hashlib.sha256(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+
+    def _cache_get(self, key):
+        if self._shared_cache is not None:
+            return self._shared_cache.get(self._cache_digest(key))
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, text = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return text
+
+    def _cache_put(self, key, text):
+        if self._shared_cache is not None:
+            self._shared_cache.put(self._cache_digest(key), text)
+            return
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl.total_seconds(), text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        if self._shared_cache is not None:
+            self._shared_cache.clear()
+        with self._lock:
+            self._cache.clear()
+
+# Shared gateway used by every Gemini call; its limit and cache are shared by all workers through the snapshot cache directory
+gemini_gateway = GeminiGateway(
+    max_in_flight=int(os.getenv('GEMINI_MAX_IN_FLIGHT', 4)),
+    queue_timeout=float(os.getenv('GEMINI_QUEUE_TIMEOUT', 30)),
+    cache_dir=DEFAULT_CACHE_DIR,
+)
+
+def generate_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, current_jkse, current_sp500, current_usdidr, usdidr_1month_ago, predictions, news_text, user_question, history, snapshot_version=None):
     try:
         logging.info("Generating recommendation")
         logging.info(f"Input data: fed_rate={fed_rate}, bi_rate={bi_rate}, inflation_id={inflation_id}, inflation_us={inflation_us}, current_jkse={current_jkse}, current_sp500={current_sp500}, current_usdidr={current_usdidr}, usdidr_1month_ago={usdidr_1month_ago}")
@@ -53,13 +260,6 @@ def generate_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, curre
         Pastikan rekomendasimu praktis, langsung ke intinya, dan mudah diikuti. Jika berita terkini menunjukkan situasi yang stabil atau tidak ada perubahan besar, sampaikan bahwa pengguna bisa menunggu sebelum mengambil keputusan.
         """
         
-        # Initialize the model
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
-            system_instruction=system_instruction
-        )
-
         # Format history according to the expected structure
         formatted_history = []
         for message in history:
@@ -68,15 +268,21 @@ def generate_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, curre
             elif message['role'] == 'assistant':
                 formatted_history.append({"role": "model", "parts": [{"text": message['content']}]})
 
-        # Create a chat session and pass the existing history
-        chat = model.start_chat(history=formatted_history)
+        # Pertanyaan pertama dalam sesi tidak bergantung pada percakapan sebelumnya, jadi jawabannya bisa dipakai ulang
+        first_turn = not any(message['role'] == 'user' for message in history)
+        cache_key = ('recommendation', normalize_question(user_question), snapshot_version, news_digest(news_text)) if first_turn and snapshot_version is not None else None
 
-        # Send the user question to the model and get the response
-        response = chat.send_message(f"{user_question}")
+        # Send the user question to the model through the gateway and get the response
+        response_text = gemini_gateway.generate(
+            f"{user_question}",
+            system_instruction=system_instruction,
+            history=formatted_history,
+            cache_key=cache_key
+        )
         
         # Add the new message to the history
         history.append({"role": "user", "content": user_question})
-        history.append({"role": "assistant", "content": response.text})
+        history.append({"role": "assistant", "content": response_text})
         
         logging.info("Recommendation generated successfully")
         return history
@@ -86,7 +292,7 @@ def generate_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, curre
 
 
 # Function to generate an analysis report and quick recommendation
-def generate_analysis_report_and_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, current_jkse, current_sp500, current_usdidr, usdidr_1month_ago, predictions, news_text):
+def generate_analysis_report_and_recommendation(fed_rate, bi_rate, inflation_id, inflation_us, current_jkse, current_sp500, current_usdidr, usdidr_1month_ago, predictions, news_text, snapshot_version=None):
     try:
         system_instruction = f"""Anda adalah seorang pakar keuangan. Buat laporan singkat dalam bentuk paragraf dengan penekanan di beberapa poin penting, berdasarkan indikator berikut:
         - Suku Bunga Fed: {fed_rate}%
@@ -107,14 +313,11 @@ def generate_analysis_report_and_recommendation(fed_rate, bi_rate, inflation_id,
         2. REKOMENDASI CEPAT: Berikan rekomendasi cepat yang terkait dengan tindakan yang harus diambil, seperti membeli, menjual, atau menahan.
         """
 
-        # Initialize the model
-        model = genai.GenerativeModel(model_name="gemini-1.5-flash", generation_config=generation_config)
-
-        # Send the instruction to the model and get the response
-        response = model.generate_content(system_instruction)
+        # Laporan bergantung pada snapshot pasar, jumlah hari prediksi dan berita di prompt, jadi di-cache per kombinasi ketiganya
+        cache_key = ('analysis', len(predictions), snapshot_version, news_digest(news_text)) if snapshot_version is not None else None
 
-        # Return the text response from the model
-        return response.text
+        # Send the instruction to the model through the gateway and return the text response
+        return gemini_gateway.generate(system_instruction, cache_key=cache_key)
     except Exception as e:
         logging.error(f"Error generating AI report: {str(e)}", exc_info=True)
         return "Terjadi kesalahan saat menghasilkan laporan dan rekomendasi."
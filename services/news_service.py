@@ -1,5 +1,7 @@
 import requests
 import pandas as pd
+from datetime import datetime, timedelta
+from services.news_store import NewsStore
 
 # Base API URL
 base_url = "https://api-berita-indonesia.vercel.app"
@@ -12,6 +14,13 @@ routes = {
     "cnn": ["internasional"]
 }
 
+# Shared store keeping news across refreshes, deduplicated and indexed
+news_store = NewsStore()
+news_refresh_interval = timedelta(minutes=10)  # Refresh interval, adjust as needed
+
+# Default query used to pick the headlines that matter for USD/IDR
+market_news_query = "rupiah dolar usd idr kurs valas forex suku bunga inflasi fed bank indonesia bi ihsg saham ekspor impor devisa"
+
 # Function to fetch data from a specific route and category
 def fetch_data(route, category):
     url = f"{base_url}/{route}/{category}"
@@ -25,35 +34,41 @@ def fetch_data(route, category):
         print(f"Error for {route}/{category}: {e}")
     return None
 
-# Function to fetch news and return combined results
-def get_combined_news():
-    combined_results = []
+# Function to fetch all routes and add new posts to the news store
+def refresh_news(force=False):
+    current_time = datetime.now()
+    if not force and news_store.last_refresh is not None and (current_time - news_store.last_refresh) < news_refresh_interval:
+        return news_store
 
     # Loop through each route and its categories to fetch data
+    fetched = False
     for route, categories in routes.items():
         for category in categories:
             data = fetch_data(route, category)
             if data and data.get('success'):
+                fetched = True
                 posts = data['data'].get('posts', [])
-                for post in posts:
-                    combined_results.append({
-                        'Title': post.get('title', 'No Title'),
-                        'Description': post.get('description', 'No Description'),
-                        'Publication Date': post.get('pubDate', 'No Date'),
-                        'Source': f"{route.capitalize()} - {category.capitalize()}",
-                        'Link': post.get('link', '#'),
-                        'Image': post.get('thumbnail', '')  # Use the thumbnail URL directly
-                    })
-
-    # Convert to DataFrame
-    combined_df = pd.DataFrame(combined_results)
-
-    # Ensure all necessary columns are present
-    for col in ['Title', 'Description', 'Publication Date', 'Source', 'Link', 'Image']:
-        if col not in combined_df.columns:
-            combined_df[col] = 'N/A'
-
-    # Ensure date is in string format
-    combined_df['Publication Date'] = combined_df['Publication Date'].astype(str)
-
-    return combined_df
+                news_store.add_many({
+                    'Title': post.get('title', 'No Title'),
+                    'Description': post.get('description', 'No Description'),
+                    'Publication Date': post.get('pubDate', 'No Date'),
+                    'Source': f"{route.capitalize()} - {category.capitalize()}",
+                    'Link': post.get('link', '#'),
+                    'Image': post.get('thumbnail', '')  # Use the thumbnail URL directly
+                } for post in posts)
+
+    # Hanya tandai sebagai segar jika ada feed yang berhasil, agar gangguan sementara segera dicoba ulang
+    if fetched:
+        news_store.last_refresh = current_time
+    return news_store
+
+# Function to fetch news and return combined, deduplicated results (newest first)
+def get_combined_news():
+    return refresh_news().to_frame()
+
+# Function to get the top-K headlines relevant to a question, formatted for the LLM prompt
+def get_relevant_headlines(query=market_news_query, k=10):
+    items = refresh_news().top_k(query, k)
+    if not items:
+        return "No recent news available."
+    return pd.DataFrame(items)['Title'].to_markdown(index=False)
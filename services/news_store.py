@@ -0,0 +1,222 @@
+import base64
+import bisect
+import hashlib
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import pandas as pd
+
+NEWS_COLUMNS = ['Title', 'Description', 'Publication Date', 'Source', 'Link', 'Image']
+
+# Kata umum (ID/EN) yang tidak ikut diindeks karena tidak membantu pencarian
+STOPWORDS = {
+    'dan', 'di', 'ke', 'dari', 'yang', 'untuk', 'pada', 'dengan', 'ini', 'itu', 'akan', 'atau', 'juga',
+    'dalam', 'oleh', 'karena', 'jadi', 'ada', 'tidak', 'apa', 'anda', 'saya', 'bisa', 'sebagai', 'usai',
+    'the', 'of', 'and', 'to', 'in', 'on', 'for', 'is', 'at', 'by', 'an', 'as', 'with',
+}
+
+TOKEN_PATTERN = re.compile(r'\w+')
+JAKARTA_TZ = timezone(timedelta(hours=7))
+
+# Function to split text into lowercase search tokens
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+# Function to normalize an article link so the same article from different feeds maps to one key
+def normalize_link(link):
+    if not isinstance(link, str) or link.strip() in ('', '#', 'N/A'):
+        return None
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not k.startswith('utm_')))
+    return f"link:{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else '')
+
+# Function to hash a headline after lowercasing and stripping punctuation
+def title_hash(title):
+    if not isinstance(title, str) or title in ('', 'No Title', 'N/A'):
+        return None
+    normalized = ' '.join(TOKEN_PATTERN.findall(title.lower()))
+    return 'title:' + hashlib.sha1(normalized.encode('utf-8')).hexdigest() if normalized else None
+
+# Function to convert a publication date string to epoch seconds (0.0 if it cannot be parsed)
+def parse_timestamp(value):
+    # Format ISO paling umum dari API berita, jadi coba parser cepat terlebih dahulu
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=JAKARTA_TZ)
+        return parsed.timestamp()
+    except (ValueError, TypeError):
+        pass
+    try:
+        ts = pd.to_datetime(value, utc=True)
+    except (ValueError, TypeError, OverflowError):
+        return 0.0
+    return 0.0 if pd.isna(ts) else ts.timestamp()
+
+def encode_cursor(key):
+    timestamp, item_id = key
+    return base64.urlsafe_b64encode(f"{timestamp!r}:{item_id}".encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        timestamp, item_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split(':')
+        return float(timestamp), int(item_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+class NewsStore:
+    """In-memory news store that keeps articles across refreshes.
+
+    Articles are deduplicated by normalized link or headline hash, and indexed by
+    token (inverted index), by source and by publication date so that searches
+    never scan the whole collection.
+    """
+
+    def __init__(self, max_items=5000):
+        self.max_items = max_items
+        self.last_refresh = None
+        self._lock = threading.Lock()
+        self._items = {}
+        self._keys = {}
+        self._item_keys = {}
+        self._tokens = defaultdict(set)
+        self._sources = defaultdict(set)
+        self._by_date = []
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        keys = [key for key in (normalize_link(item.get('Link')), title_hash(item.get('Title'))) if key]
+        with self._lock:
+            if not keys or any(key in self._keys for key in keys):
+                return False
+
+            item_id = self._next_id
+            self._next_id += 1
+            stored = {col: item.get(col, 'N/A') for col in NEWS_COLUMNS}
+            stored['Publication Date'] = str(stored['Publication Date'])
+            timestamp = parse_timestamp(stored['Publication Date'])
+
+            self._items[item_id] = (timestamp, stored)
+            self._item_keys[item_id] = keys
+            for key in keys:
+                self._keys[key] = item_id
+            for token in set(tokenize(stored['Title'])) | set(tokenize(stored['Description'])):
+                self._tokens[token].add(item_id)
+            for source_key in self._source_keys(stored['Source']):
+                self._sources[source_key].add(item_id)
+            bisect.insort(self._by_date, (timestamp, item_id))
+
+            # Buang berita paling lama jika store sudah penuh
+            while len(self._items) > self.max_items:
+                self._remove(self._by_date[0][1])
+            return True
+
+    def add_many(self, items):
+        return sum(1 for item in items if self.add(item))
+
+    def _remove(self, item_id):
+        timestamp, stored = self._items.pop(item_id)
+        for key in self._item_keys.pop(item_id):
+            self._keys.pop(key, None)
+        for token in set(tokenize(stored['Title'])) | set(tokenize(stored['Description'])):
+            self._discard(self._tokens, token, item_id)
+        for source_key in self._source_keys(stored['Source']):
+            self._discard(self._sources, source_key, item_id)
+        del self._by_date[bisect.bisect_left(self._by_date, (timestamp, item_id))]
+
+    @staticmethod
+    def _discard(index, key, item_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del index[key]
+
+    @staticmethod
+    def _source_keys(source):
+        # "Sindonews - Ekbis" bisa dicari sebagai "sindonews - ekbis" maupun "sindonews"
+        source = str(source).lower().strip()
+        return {source, source.split(' - ')[0]}
+
+    def search(self, q=None, source=None, start=None, end=None, cursor=None, limit=None):
+        """Return (items, next_cursor) newest first.
+
+        ``q`` matches articles containing every token, ``source`` matches a full
+        source name or its site prefix, ``start``/``end`` are epoch seconds
+        (start inclusive, end exclusive) and ``cursor`` is the ``next_cursor`` of
+        the previous page.
+        """
+        with self._lock:
+            candidates = None
+            filters = []
+            if q:
+                query_tokens = set(tokenize(q))
+                # Query yang hanya berisi stopword atau token satu huruf tidak cocok dengan berita apa pun
+                if not query_tokens:
+                    return [], None
+                filters.extend(self._tokens.get(token, set()) for token in query_tokens)
+            if source:
+                filters.append(self._sources.get(source.lower().strip(), set()))
+            if filters:
+                filters.sort(key=len)
+                candidates = filters[0].intersection(*filters[1:])
+
+            lo = bisect.bisect_left(self._by_date, (start, -1)) if start is not None else 0
+            hi = bisect.bisect_left(self._by_date, (end, -1)) if end is not None else len(self._by_date)
+            if cursor:
+                hi = min(hi, bisect.bisect_left(self._by_date, decode_cursor(cursor)))
+
+            if candidates is None:
+                first = lo if limit is None else max(lo, hi - limit)
+                selected = self._by_date[first:hi][::-1]
+                has_more = first > lo
+            else:
+                matches = []
+                if lo < hi:
+                    low_key = self._by_date[lo]
+                    high_key = self._by_date[hi] if hi < len(self._by_date) else None
+                    keys = ((self._items[i][0], i) for i in candidates)
+                    matches = [key for key in keys if key >= low_key and (high_key is None or key < high_key)]
+                selected = heapq.nlargest(limit, matches) if limit is not None else sorted(matches, reverse=True)
+                has_more = limit is not None and len(matches) > limit
+
+            items = [dict(self._items[item_id][1]) for _, item_id in selected]
+            next_cursor = encode_cursor(selected[-1]) if has_more and selected else None
+            return items, next_cursor
+
+    def top_k(self, query, k=10):
+        """Return the k articles most relevant to ``query`` (newest first when no token matches)."""
+        with self._lock:
+            scores = defaultdict(float)
+            total = len(self._items)
+            for token in set(tokenize(query)):
+                ids = self._tokens.get(token)
+                if not ids:
+                    continue
+                idf = math.log(1 + total / len(ids))
+                for item_id in ids:
+                    scores[item_id] += idf
+            if scores:
+                ranked = heapq.nlargest(k, scores, key=lambda i: (scores[i], self._items[i][0], i))
+            else:
+                ranked = [item_id for _, item_id in self._by_date[:-k - 1:-1]] if k > 0 else []
+            return [dict(self._items[item_id][1]) for item_id in ranked]
+
+    def to_frame(self):
+        with self._lock:
+            rows = [self._items[item_id][1] for _, item_id in reversed(self._by_date)]
+        return pd.DataFrame(rows, columns=NEWS_COLUMNS)
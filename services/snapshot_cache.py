@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya ada kunci antar-thread di dalam satu proses
+    fcntl = None
+
+# Shared by every worker of a deployment unless overridden; one directory per user so another account cannot claim the name first
+DEFAULT_CACHE_DIR = os.environ.get('SNAPSHOT_CACHE_DIR', os.path.join(tempfile.gettempdir(), f"forex-dashboard-cache-{os.getuid() if hasattr(os, 'getuid') else 'user'}"))
+
+# Function to create the cache directory (mode 0700) and refuse one that another user owns or could write into
+def ensure_private_dir(path):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Cache directory {path} is not a directory (symlink?)")
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"Cache directory {path} is owned by uid {info.st_uid}, not by the current user {os.getuid()}")
+        if info.st_mode & 0o077:
+            # Direktori milik sendiri tetapi terbuka untuk user lain: tutup sebelum dipakai
+            os.chmod(path, 0o700)
+    return path
+
+class Snapshot:
+    """A read-only view of one snapshot on disk.
+
+    Numeric columns live in one Fortran-ordered ``values.npy`` and text columns in
+    one ``.npy`` each; all of them are memory-mapped, so every worker shares the
+    same pages from the OS page cache instead of holding its own copy.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.version = manifest['version']
+        self.created_at = manifest['created_at']
+        self.meta = manifest['meta']
+        self.columns = manifest['columns']
+        self._numeric = manifest['numeric_columns']
+        self._text = manifest['text_columns']
+        self._values = self._load('values.npy')
+        self._text_values = {col: self._load(f'text_{i}.npy') for i, col in enumerate(self._text)}
+
+    def _load(self, filename):
+        full_path = os.path.join(self.path, filename)
+        try:
+            return np.load(full_path, mmap_mode='r')
+        except ValueError:
+            # File tanpa data (mis. frame kosong) tidak bisa di-mmap
+            return np.load(full_path)
+
+    def __len__(self):
+        return self._values.shape[0]
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes + sum(values.nbytes for values in self._text_values.values())
+
+    def column(self, name):
+        if name in self._text_values:
+            return self._text_values[name]
+        return self._values[:, self._numeric.index(name)]
+
+    def frame(self):
+        data = {col: self.column(col) for col in self.columns}
+        return pd.DataFrame(data, columns=self.columns, copy=False)
+
+class SnapshotCache:
+    """Snapshot of a DataFrame plus metadata shared by all processes on one host.
+
+    The first caller that finds the snapshot missing or older than ``ttl`` takes an
+    exclusive file lock, rebuilds it with ``build`` and swaps it in atomically by
+    replacing ``current.json``. Other processes keep serving the previous
+    snapshot meanwhile, or wait on the lock when there is none yet, so a refresh
+    happens once per host rather than once per worker.
+    """
+
+    def __init__(self, build, ttl, cache_dir=DEFAULT_CACHE_DIR, name='market'):
+        self.build = build
+        self.ttl = ttl
+        self.path = os.path.join(ensure_private_dir(cache_dir), name)
+        os.makedirs(self.path, exist_ok=True)
+        self._pointer_path = os.path.join(self.path, 'current.json')
+        self._lock_path = os.path.join(self.path, 'refresh.lock')
+        self._thread_lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self):
+        snapshot = self._read_current()
+        if snapshot is None:
+            snapshot = self._refresh(blocking=True)
+        elif self._is_stale(snapshot):
+            try:
+                snapshot = self._refresh(blocking=False) or snapshot
+            except Exception as e:
+                # Gagal memperbarui: tetap layani snapshot lama daripada mengembalikan error
+                logging.error(f"Refreshing snapshot {self.path} failed, serving version {snapshot.version}: {str(e)}", exc_info=True)
+        return snapshot
+
+    def clear(self):
+        with self._thread_lock:
+            self._snapshot = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+
+    def _is_stale(self, snapshot):
+        # Snapshot yang dibangun dari data tidak lengkap langsung dianggap basi agar segera dicoba ulang
+        return not snapshot.meta.get('complete', True) or (time.time() - snapshot.created_at) > self.ttl.total_seconds()
+
+    def _read_current(self):
+        try:
+            with open(self._pointer_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if self._snapshot is not None and self._snapshot.version == manifest['version']:
+            return self._snapshot
+        try:
+            self._snapshot = Snapshot(os.path.join(self.path, manifest['dir']), manifest)
+        except FileNotFoundError:
+            # Snapshot lama sudah dihapus oleh proses lain; baca ulang pointer terbaru
+            return self._read_current() if self._pointer_changed(manifest) else None
+        return self._snapshot
+
+    def _pointer_changed(self, manifest):
+        try:
+            with open(self._pointer_path, encoding='utf-8') as f:
+                return json.load(f)['version'] != manifest['version']
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def _refresh(self, blocking):
+        if not self._thread_lock.acquire(blocking=blocking):
+            return None
+        try:
+            lock_file = open(self._lock_path, 'a+')
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                    except BlockingIOError:
+                        return None
+                # Proses lain mungkin baru saja selesai memperbarui snapshot selama kita menunggu kunci
+                snapshot = self._read_current()
+                if snapshot is not None and not self._is_stale(snapshot):
+                    return snapshot
+                frame, meta = self.build()
+                return self._write(frame, meta)
+            finally:
+                lock_file.close()
+        finally:
+            self._thread_lock.release()
+
+    def _write(self, frame, meta):
+        version = time.time_ns()
+        dirname = f'snapshot-{version}'
+        tmp_path = os.path.join(self.path, dirname + '.tmp')
+        os.makedirs(tmp_path)
+
+        numeric = [col for col in frame.columns if pd.api.types.is_numeric_dtype(frame[col])]
+        text = [col for col in frame.columns if col not in numeric]
+        values = np.asfortranarray(frame[numeric].to_numpy(dtype=np.float64)) if numeric else np.empty((len(frame), 0))
+        np.save(os.path.join(tmp_path, 'values.npy'), values)
+        for i, col in enumerate(text):
+            np.save(os.path.join(tmp_path, f'text_{i}.npy'), frame[col].astype(str).to_numpy(dtype=str))
+        os.rename(tmp_path, os.path.join(self.path, dirname))
+
+        manifest = {
+            'version': version,
+            'dir': dirname,
+            'created_at': time.time(),
+            'columns': [str(col) for col in frame.columns],
+            'numeric_columns': [str(col) for col in numeric],
+            'text_columns': [str(col) for col in text],
+            'meta': meta,
+        }
+        pointer_tmp = f'{self._pointer_path}.{os.getpid()}.tmp'
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(pointer_tmp, self._pointer_path)
+        logging.info(f"Snapshot {self.path} refreshed to version {version}")
+
+        self._remove_old_snapshots()
+        self._snapshot = Snapshot(os.path.join(self.path, dirname), manifest)
+        return self._snapshot
+
+    def _remove_old_snapshots(self, keep=2):
+        # Snapshot sebelumnya dipertahankan untuk pembaca yang baru saja membaca pointer lama
+        snapshots = sorted((entry for entry in os.listdir(self.path) if entry.startswith('snapshot-')),
+                           key=lambda entry: int(entry.split('-')[1].split('.')[0]))
+        for entry in snapshots[:-keep]:
+            shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+class SessionStore:
+    """Chat histories in SQLite so every worker sees the same conversation.
+
+    Sessions not updated for ``max_age`` are treated as missing and deleted on
+    the next write, so the database does not grow with every visitor.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, filename='sessions.sqlite3', max_age=timedelta(hours=24)):
+        self.path = os.path.join(ensure_private_dir(cache_dir), filename)
+        self.max_age = max_age
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute('CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)')
+        self._execute('CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)')
+
+    def _execute(self, sql, params=()):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def _cutoff(self):
+        return time.time() - self.max_age.total_seconds()
+
+    def __contains__(self, session_id):
+        return self._execute('SELECT 1 FROM sessions WHERE session_id = ? AND updated_at >= ?', (session_id, self._cutoff())) is not None
+
+    def __getitem__(self, session_id):
+        row = self._execute('SELECT history FROM sessions WHERE session_id = ? AND updated_at >= ?', (session_id, self._cutoff()))
+        if row is None:
+            raise KeyError(session_id)
+        return json.loads(row[0])
+
+    def __setitem__(self, session_id, history):
+        self._execute(
+            'INSERT INTO sessions (session_id, history, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(session_id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at',
+            (session_id, json.dumps(history), time.time())
+        )
+        self.remove_expired()
+
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM sessions')[0]
+
+    def remove_expired(self):
+        # Sesi yang tidak aktif lebih lama dari max_age dihapus permanen
+        self._execute('DELETE FROM sessions WHERE updated_at < ?', (self._cutoff(),))
+
+# Function to take an exclusive flock on path without blocking; returns the open file, or None if another holder has it
+def try_lock_file(path):
+    lock_file = open(path, 'a+')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+class HostSemaphore:
+    """Semaphore shared by all processes on one host.
+
+    Each of the ``size`` slots is a lock file held with ``flock``; waiters poll
+    for a free slot until their timeout. The kernel drops the lock when a
+    process dies, so a crashed worker never keeps a slot. Without ``fcntl``
+    (Windows) it falls back to a semaphore for this process only.
+    """
+
+    def __init__(self, size, cache_dir=DEFAULT_CACHE_DIR, name='slots', poll_interval=0.01):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.path = os.path.join(ensure_private_dir(cache_dir), name)
+        os.makedirs(self.path, exist_ok=True)
+        self._local = threading.local()
+        self._fallback = threading.BoundedSemaphore(size) if fcntl is None else None
+
+    def acquire(self, timeout=None):
+        if self._fallback is not None:
+            return self._fallback.acquire(timeout=timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for i in range(self.size):
+                lock_file = try_lock_file(os.path.join(self.path, f'slot-{i}.lock'))
+                if lock_file is not None:
+                    self._held().append(lock_file)
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        if self._fallback is not None:
+            self._fallback.release()
+        else:
+            self._held().pop().close()
+
+    def _held(self):
+        # Slot yang dipegang dicatat per thread, karena setiap thread membuka file kuncinya sendiri
+        if not hasattr(self._local, 'files'):
+            self._local.files = []
+        return self._local.files
+
+class AnswerCache:
+    """Text answers in SQLite, shared by every worker and kept for ``ttl``.
+
+    Expired answers are deleted on write and at most ``max_entries`` are kept,
+    dropping the ones that expire first.
+    """
+
+    def __init__(self, ttl, max_entries=256, cache_dir=DEFAULT_CACHE_DIR, filename='answers.sqlite3'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = os.path.join(ensure_private_dir(cache_dir), filename)
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute('CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)')
+        self._execute('CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)')
+
+    def _execute(self, sql, params=()):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def get(self, key):
+        row = self._execute('SELECT text FROM answers WHERE key = ? AND expires_at >= ?', (key, time.time()))
+        return None if row is None else row[0]
+
+    def put(self, key, text):
+        now = time.time()
+        self._execute('INSERT OR REPLACE INTO answers (key, text, expires_at) VALUES (?, ?, ?)', (key, text, now + self.ttl.total_seconds()))
+        self._execute('DELETE FROM answers WHERE expires_at < ?', (now,))
+        self._execute('DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY expires_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def clear(self):
+        self._execute('DELETE FROM answers')
@@ -202,7 +202,7 @@ function updateAIInsight(data) {
 async function fetchNews() {
     console.log("Fetching news");
     try {
-        const response = await fetch(`${API_BASE_URL}/news`);
+        const response = await fetch(`${API_BASE_URL}/news?limit=10`);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }